@@ -26,48 +26,101 @@ from __future__ import annotations
 import argparse
 import os
 import re
+import shutil
 import sys
+import tempfile
 from datetime import datetime
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
 
 MD_EXTS = {'.md', '.markdown'}
+MD_SUFFIXES = tuple(MD_EXTS)
+SKIP_DIRS = {'.git', '.idea', '.svn', '.hg', '__pycache__'}
 
-SlugCache = {}
+_SLUG_STRIP_RE = re.compile(r'[^0-9A-Za-z\u4e00-\u9fa5]+')
+_HEX_NAME_RE = re.compile(r'[0-9a-fA-F-]+')
 
-def make_slug(text: str) -> str:
-    base = re.sub(r'[^0-9A-Za-z\u4e00-\u9fa5]+', '-', text.strip()).strip('-').lower()
+_GUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+_DATE_IN_LOCALTIME_RE = re.compile(r'^> \s*本地时间: (\d{4}-\d{2}-\d{2})', re.MULTILINE)
+_SESSION_HEADING_RE = re.compile(r'^#\s*会话记录\s*(.+)$', re.MULTILINE)
+# 会话标题位于生成文件开头; 首条消息时间通常也在其中 (首条请求无时间戳时会更靠后, 需回退全文查找)
+_HEAD_SCAN_CHARS = 2000
+# 输出文件缓冲与分块复制大小: 大块顺序写入, 内存占用恒定
+WRITE_CHUNK_SIZE = 1 << 20
+
+def make_slug(text: str, slug_counts: Dict[str, int]) -> str:
+    """生成唯一 slug. slug_counts 记录已用 slug 及每个 base 的已分配次数 (由调用方按次聚合持有)."""
+    base = _SLUG_STRIP_RE.sub('-', text.strip()).strip('-').lower()
     if not base:
         base = 'section'
+    n = slug_counts.get(base, 0)
     slug = base
-    i = 2
-    while slug in SlugCache:
-        slug = f"{base}-{i}"
-        i += 1
-    SlugCache[slug] = True
+    if n:
+        slug = f"{base}-{n + 1}"
+        # 极少数情况下 base-N 已作为其它文本的 slug 使用
+        while slug in slug_counts:
+            n += 1
+            slug = f"{base}-{n + 1}"
+    slug_counts[base] = n + 1
+    slug_counts.setdefault(slug, 1)
     return slug
 
-def iter_markdown_files(root: str) -> List[str]:
-    files: List[str] = []
-    for dirpath, dirnames, filenames in os.walk(root):
-        # 可在此处过滤目录 (如 .git 等)
-        dirnames[:] = [d for d in dirnames if d not in {'.git', '.idea', '.svn', '.hg', '__pycache__'}]
-        for fn in filenames:
-            if fn.startswith('~'):
+def iter_markdown_files(root: str) -> Iterator[Tuple[str, float]]:
+    """递归遍历 root 下的 Markdown 文件, 产出 (路径, mtime).
+    基于 os.scandir: 类型与 mtime 取自 DirEntry 缓存 (Windows 上无额外 stat), 排序时无需再次 stat。
+    """
+    try:
+        it = os.scandir(root)
+    except OSError:
+        return
+    subdirs: List[str] = []
+    with it:
+        for entry in it:
+            name = entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # 可在此处过滤目录 (如 .git 等)
+                    if name not in SKIP_DIRS:
+                        subdirs.append(entry.path)
+                    continue
+            except OSError:
                 continue
-            ext = os.path.splitext(fn)[1].lower()
-            if ext in MD_EXTS:
-                full = os.path.join(dirpath, fn)
-                files.append(full)
-    return files
+            if name.startswith('~'):
+                continue
+            if name.lower().endswith(MD_SUFFIXES):
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                yield entry.path, mtime
+    # 与 os.walk 一致: 先输出当前目录文件, 再进入子目录
+    for d in subdirs:
+        yield from iter_markdown_files(d)
+
+def _as_pattern(pat: str|Pattern[str]|None) -> Pattern[str]|None:
+    """接受正则字符串或已编译的 Pattern (如 GUI 预编译), 空值返回 None."""
+    if not pat:
+        return None
+    return pat if isinstance(pat, re.Pattern) else re.compile(pat)
 
-def filter_files(files: List[str], root: str, include_pat: str|None, exclude_pat: str|None) -> List[str]:
+def _rel_path_fn(root: str) -> Callable[[str], str]:
+    """返回求相对路径 ('/' 分隔) 的函数. scandir 产出的路径均为 root + 分隔符 + 名称,
+    直接切掉前缀即可, 避免逐文件调用 os.path.relpath (需 abspath/split, Windows 上开销明显)。
+    """
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    n = len(prefix)
     def rel(p: str) -> str:
-        return os.path.relpath(p, root).replace('\\', '/')
-    include_re = re.compile(include_pat) if include_pat else None
-    exclude_re = re.compile(exclude_pat) if exclude_pat else None
+        r = p[n:] if p.startswith(prefix) else os.path.relpath(p, root)
+        return r.replace('\\', '/')
+    return rel
+
+def filter_files(files: Iterable[Tuple[str, float]], root: str,
+                 include_pat: str|Pattern[str]|None, exclude_pat: str|Pattern[str]|None) -> List[Tuple[str, float]]:
+    rel = _rel_path_fn(root)
+    include_re = _as_pattern(include_pat)
+    exclude_re = _as_pattern(exclude_pat)
     out = []
     for f in files:
-        r = rel(f)
+        r = rel(f[0])
         if include_re and not include_re.search(r):
             continue
         if exclude_re and exclude_re.search(r):
@@ -75,10 +128,13 @@ def filter_files(files: List[str], root: str, include_pat: str|None, exclude_pat
         out.append(f)
     return out
 
-def sort_files(files: List[str], mode: str) -> List[str]:
+def sort_files(files: List[Tuple[str, float]], mode: str) -> List[str]:
+    """按 mtime 或文件名排序 (files 为 (路径, mtime)), 返回路径列表."""
     if mode == 'mtime':
-        return sorted(files, key=lambda p: os.path.getmtime(p))
-    return sorted(files, key=lambda p: os.path.basename(p).lower())
+        ordered = sorted(files, key=lambda f: f[1])
+    else:
+        ordered = sorted(files, key=lambda f: os.path.basename(f[0]).lower())
+    return [f[0] for f in ordered]
 
 def read_file(path: str) -> Tuple[str, str]:
     try:
@@ -87,6 +143,32 @@ def read_file(path: str) -> Tuple[str, str]:
     except Exception as e:
         return '', str(e)
 
+def derive_display_name(rel_path: str, content: str) -> str:
+    """GUID 命名的会话文件显示为 '会话记录 <日期> <标题前8位>', 其它文件显示相对路径."""
+    fname = os.path.splitext(os.path.basename(rel_path))[0]
+    # 仅处理 GUID / 长十六进制文件名 (> 24 字符, GUID 亦属此类); 较短文件名无需跑正则
+    if len(fname) <= 24:
+        return rel_path
+    if _HEX_NAME_RE.fullmatch(fname):
+        head = content[:_HEAD_SCAN_CHARS]
+        # 尝试提取日期
+        m_date = _DATE_IN_LOCALTIME_RE.search(head) or _DATE_IN_LOCALTIME_RE.search(content)
+        date_part = m_date.group(1) if m_date else ''
+        m_head = _SESSION_HEADING_RE.search(head)
+        head_tail = m_head.group(1).strip() if m_head else ''
+        # 如果标题尾部仍是 GUID, 剪裁为前8位
+        if _GUID_RE.match(head_tail):
+            head_tail = head_tail[:8]
+        if date_part and head_tail:
+            return f"会话记录 {date_part} {head_tail}"
+        if date_part:
+            return f"会话记录 {date_part}"
+        if head_tail:
+            return f"会话记录 {head_tail}"
+        # 回退为文件相对路径
+        return rel_path
+    return rel_path
+
 def build_index(entries: List[Tuple[str, str]]) -> str:
     lines = ['# 汇总索引', '']
     for rel_path, slug in entries:
@@ -94,63 +176,73 @@ def build_index(entries: List[Tuple[str, str]]) -> str:
     lines.append('\n---\n')
     return '\n'.join(lines)
 
-def aggregate(root: str, output: str, sort_mode: str, include_pat: str|None, exclude_pat: str|None) -> str:
+def aggregate(root: str, output: str, sort_mode: str,
+              include_pat: str|Pattern[str]|None, exclude_pat: str|Pattern[str]|None,
+              chunk_cb: Optional[Callable[[int, int], None]] = None) -> str:
+    root = os.path.abspath(root)
+    return aggregate_from_list(iter_markdown_files(root), root, output, sort_mode, include_pat, exclude_pat,
+                               chunk_cb=chunk_cb)
+
+def aggregate_from_list(entries: Iterable[Tuple[str, float]], root: str, output: str, sort_mode: str,
+                        include_pat: str|Pattern[str]|None, exclude_pat: str|Pattern[str]|None,
+                        chunk_cb: Optional[Callable[[int, int], None]] = None) -> str:
+    """聚合给定的 (路径, mtime) 列表, 不再遍历目录 (如生成步骤已知全部输出文件).
+    root 用于计算相对路径 (标题 / 锚点 / 过滤)。
+    chunk_cb(bytes_written, total_bytes): 写出汇总文件时每块回调一次, 用于进度显示。
+    """
     root = os.path.abspath(root)
-    all_files = iter_markdown_files(root)
-    all_files = filter_files(all_files, root, include_pat, exclude_pat)
+    all_files = filter_files(entries, root, include_pat, exclude_pat)
     output_abs = os.path.abspath(output)
-    all_files = [f for f in all_files if os.path.abspath(f) != output_abs]
+    all_files = [f for f in all_files if os.path.abspath(f[0]) != output_abs]
     if not all_files:
         raise SystemExit('未发现可聚合的 Markdown 文件')
     all_files = sort_files(all_files, sort_mode)
 
     rel_slug_pairs: List[Tuple[str, str]] = []  # (显示名称, slug)
-    sections: List[str] = []
-
-    guid_re = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
-    date_in_localtime_re = re.compile(r'^> \s*本地时间: (\d{4}-\d{2}-\d{2})', re.MULTILINE)
-    heading_re = re.compile(r'^#\s*会话记录\s*(.+)$', re.MULTILINE)
-
-    def derive_display_name(rel_path: str, content: str) -> str:
-        fname = os.path.splitext(os.path.basename(rel_path))[0]
-        if guid_re.match(fname) or (len(fname) > 24 and re.fullmatch(r'[0-9a-fA-F-]+', fname)):
-            # 尝试提取日期
-            m_date = date_in_localtime_re.search(content)
-            date_part = m_date.group(1) if m_date else ''
-            m_head = heading_re.search(content)
-            head_tail = m_head.group(1).strip() if m_head else ''
-            # 如果标题尾部仍是 GUID, 剪裁为前8位
-            if guid_re.match(head_tail):
-                head_tail = head_tail[:8]
-            if date_part and head_tail:
-                return f"会话记录 {date_part} {head_tail}"
-            if date_part:
-                return f"会话记录 {date_part}"
-            if head_tail:
-                return f"会话记录 {head_tail}"
-            # 回退为文件相对路径
-            return rel_path
-        return rel_path
+    slug_counts: Dict[str, int] = {}
 
-    for path in all_files:
-        rel_path = os.path.relpath(path, root).replace('\\', '/')
-        content, err = read_file(path)
-        if err:
-            print(f"[WARN] 读取失败 {rel_path}: {err}")
-            continue
-        slug = make_slug(rel_path)
-        display_name = derive_display_name(rel_path, content)
-        rel_slug_pairs.append((display_name, slug))
-        header = f"## {rel_path}\n"  # 二级标题
-        # 如果文件首行已有#标题, 保留, 但前面插入注释说明来源
-        decorated = f"<!-- SOURCE: {rel_path} -->\n" + content.strip() + '\n'
-        sections.append(f"<a id='{slug}'></a>\n{header}\n{decorated}\n")
-
-    index_md = build_index(rel_slug_pairs)
-    meta = f"<!-- Generated at {datetime.now().isoformat()} from root {root} -->\n\n"
-    final_md = meta + index_md + '\n'.join(sections)
-    with open(output, 'w', encoding='utf-8', newline='') as fw:
-        fw.write(final_md)
+    # 正文逐段写入临时文件, 索引需全部 slug 确定后才能生成; 内存峰值仅为单个文件大小
+    rel = _rel_path_fn(root)
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as body:
+        for path in all_files:
+            rel_path = rel(path)
+            content, err = read_file(path)
+            if err:
+                print(f"[WARN] 读取失败 {rel_path}: {err}")
+                continue
+            slug = make_slug(rel_path, slug_counts)
+            display_name = derive_display_name(rel_path, content)
+            if rel_slug_pairs:
+                body.write('\n')
+            rel_slug_pairs.append((display_name, slug))
+            header = f"## {rel_path}\n"  # 二级标题
+            # 如果文件首行已有#标题, 保留, 但前面插入注释说明来源
+            body.write(f"<a id='{slug}'></a>\n{header}\n<!-- SOURCE: {rel_path} -->\n")
+            body.write(content.strip())
+            body.write('\n\n')
+
+        index_md = build_index(rel_slug_pairs)
+        meta = f"<!-- Generated at {datetime.now().isoformat()} from root {root} -->\n\n"
+        head = (meta + index_md).encode('utf-8')
+        # 正文已是 UTF-8 字节, 直接按字节分块复制, 无需再次解码/编码
+        body.flush()
+        src = body.buffer
+        total = len(head) + os.fstat(src.fileno()).st_size
+        src.seek(0)
+        with open(output, 'wb', buffering=WRITE_CHUNK_SIZE) as fw:
+            fw.write(head)
+            if chunk_cb is None:
+                shutil.copyfileobj(src, fw, WRITE_CHUNK_SIZE)
+            else:
+                written = len(head)
+                chunk_cb(written, total)
+                while True:
+                    chunk = src.read(WRITE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    fw.write(chunk)
+                    written += len(chunk)
+                    chunk_cb(written, total)
     return output
 
 def main():
@@ -19,6 +19,10 @@ chat_json_to_md.py
     python chat_json_to_md.py session.json -o session.md
     # 目录批量 (输出与原 JSON 同目录同名 .md)
     python chat_json_to_md.py path/to/folder
+    # 目录批量并行 (默认多进程, 可加 --parallel-mode threads 改为线程池)
+    python chat_json_to_md.py path/to/folder --parallel
+    # 目录批量异步并发 (网络共享/机械硬盘)
+    python chat_json_to_md.py path/to/folder --async
     # 不带参数: 等价于 python chat_json_to_md.py .
     python chat_json_to_md.py
 
@@ -33,29 +37,67 @@ chat_json_to_md.py
 """
 from __future__ import annotations
 import argparse
-import base64
+import asyncio
+import io
 import json
+import mmap
 import os
 import re
 import shutil
 import urllib.parse
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Tuple, Set, Callable
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Union, Callable
+import multiprocessing
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+try:  # 进程间 Event 类型, 用于识别调用方已传入可跨进程共享的取消标记
+    from multiprocessing.synchronize import Event as _ProcessEvent
+except ImportError:  # 平台不支持进程间信号量
+    _ProcessEvent = None
+
+try:  # 可选加速: orjson 解析速度明显快于标准库 json
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # 可选加速: google-re2 (仅用于代码块扫描, 其余正则保持标准库 re)
+    import re2 as _re_engine
+except ImportError:
+    _re_engine = re
+
+try:  # 可选加速: pybase64 使用 SIMD 编码且释放 GIL, 接口与标准库 base64 一致
+    import pybase64 as _b64
+except ImportError:
+    import base64 as _b64
 
 Line = Dict[str, Any]
+# 批量转换的输入条目: 路径, 或附带遍历时已取得 stat 结果的 (路径, stat)
+PathEntry = Union[str, Tuple[str, os.stat_result]]
+
+# 预编译正则 (避免每次调用重复查找/编译)
+# 代码块扫描作用于整段消息, 可选使用 google-re2 (线性时间, 无回溯); 用内联 (?s) 以兼容两种引擎
+_CODE_BLOCK_RE = _re_engine.compile(r"(?s)```(.*?)```")
+_MULTI_NL_RE = re.compile(r'\n{3,}')
+_WIN_DRIVE_RE = re.compile(r'^/[A-Za-z]:')
+_WS_RE = re.compile(r'\s+')
+_PATH_SEP_RE = re.compile(r'[\\/]')
+_MULTI_SLASH_RE = re.compile(r'/{2,}')
 
 def load_json(path: str) -> Dict[str, Any]:
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # 以字节读取: orjson 直接接受 bytes, 标准库 json.loads 也可自动识别 UTF-8 字节
+    with open(path, 'rb') as f:
+        buf = f.read()
+    if orjson is not None:
+        return orjson.loads(buf)
+    return json.loads(buf)
 
 def is_chat_session_json(data: Dict[str, Any]) -> bool:
     """判定是否为聊天会话 JSON:
     条件:
       - version == 3
       - 存在 requests 列表
-      - 列表中至少有一个元素包含 message 或 response
+      - 列表前 8 个元素中至少有一个包含 message 或 response (结构统一, 无需扫描全部)
     """
     if not isinstance(data, dict):
         return False
@@ -64,10 +106,7 @@ def is_chat_session_json(data: Dict[str, Any]) -> bool:
     reqs = data.get('requests')
     if not isinstance(reqs, list) or not reqs:
         return False
-    for r in reqs:
-        if isinstance(r, dict) and ('message' in r or 'response' in r):
-            return True
-    return False
+    return any(isinstance(r, dict) and ('message' in r or 'response' in r) for r in reqs[:8])
 
 def extract_text_from_message(msg: Dict[str, Any]) -> str:
     if not msg:
@@ -87,9 +126,11 @@ def sanitize_markdown(text: str) -> str:
     if not text:
         return ''
     # 规范换行: 去掉过多空行(>3连)为2行
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = _MULTI_NL_RE.sub('\n\n', text)
     return text.rstrip()
 
+_LOCAL_TIME_FMT = '%Y-%m-%d %H:%M:%S %Z'
+
 def _format_timestamp(ms: Optional[int]) -> Tuple[str, str]:
     """毫秒(或秒)时间戳 -> (本地时间, UTC ISO8601)"""
     if ms is None:
@@ -97,8 +138,9 @@ def _format_timestamp(ms: Optional[int]) -> Tuple[str, str]:
     if ms < 10_000_000_000:  # 应对可能的秒级时间戳
         ms *= 1000
     dt_utc = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    # 按时间戳自身解析本地时区 (历史偏移 / 夏令时可能与当前不同, 不可缓存固定偏移)
     local_dt = dt_utc.astimezone()
-    return local_dt.strftime('%Y-%m-%d %H:%M:%S %Z'), dt_utc.isoformat()
+    return local_dt.strftime(_LOCAL_TIME_FMT), dt_utc.isoformat()
 
 
 def _decode_file_uri(uri: str) -> str:
@@ -109,7 +151,7 @@ def _decode_file_uri(uri: str) -> str:
     path_part = uri.split('://', 1)[-1]
     path_part = urllib.parse.unquote(path_part)
     # Windows 常见会多一个前导 /
-    if re.match(r'^/[A-Za-z]:', path_part):
+    if _WIN_DRIVE_RE.match(path_part):
         path_part = path_part[1:]
     return path_part
 
@@ -137,7 +179,7 @@ def extract_messages(data: Dict[str, Any]) -> List[Line]:
                         candidate_path = full_name
                     elif isinstance(raw_id, str) and raw_id.lower().startswith('file:'):
                         candidate_path = _decode_file_uri(raw_id)
-                    elif name and re.search(r'[\\/]', name):
+                    elif name and _PATH_SEP_RE.search(name):
                         candidate_path = name
                     display = name or os.path.basename(candidate_path) or raw_id or 'file'
                     if candidate_path:
@@ -172,24 +214,33 @@ def extract_messages(data: Dict[str, Any]) -> List[Line]:
                     })
     return lines
 
-def _collect_code_stats(lines: List[Line]) -> Dict[str, Any]:
-    code_block_pattern = re.compile(r"```(.*?)```", re.DOTALL)
+def _collect_stats(lines: List[Line]) -> Dict[str, Any]:
+    """单次遍历统计用户/助手消息数与代码块信息."""
     lang_counter: Dict[str, int] = {}
+    user_count = 0
+    assistant_count = 0
     code_blocks = 0
     code_block_lines = 0
     for ln in lines:
+        role = ln['role']
+        if role == 'user':
+            user_count += 1
+        elif role == 'assistant':
+            assistant_count += 1
         content = ln['content']
-        for m in code_block_pattern.finditer(content):
+        for m in _CODE_BLOCK_RE.finditer(content):
             code_blocks += 1
-            block = m.group(0)
-            first_line = block.split('\n', 1)[0]
-            lang = first_line.strip('`').strip().lower()
+            # 单次匹配内完成语言与行数统计: 首行截取 + count, 不再 split 生成行列表
+            inner = m.group(1)
+            nl = inner.find('\n')
+            lang = (inner if nl < 0 else inner[:nl]).strip('`').strip().lower()
             if lang:
                 lang_counter[lang] = lang_counter.get(lang, 0) + 1
-            inner_lines = block.strip().split('\n')
-            if len(inner_lines) >= 2:
-                code_block_lines += max(0, len(inner_lines) - 2)
+            # 内部行数 = 总行数 - 开始/结束分隔行
+            code_block_lines += max(0, inner.count('\n') - 1)
     return {
+        'user_count': user_count,
+        'assistant_count': assistant_count,
         'code_blocks': code_blocks,
         'code_block_lines': code_block_lines,
         'code_langs': lang_counter,
@@ -200,27 +251,25 @@ def render_markdown(data: Dict[str, Any], lines: List[Line], embed_ctx: Optional
     session_id = data.get('sessionId', 'unknown-session')
     requester = data.get('requesterUsername') or data.get('requester', {}).get('username') or 'user'
     responder = data.get('responderUsername') or data.get('responder', {}).get('username') or 'assistant'
-    user_count = sum(1 for l in lines if l['role'] == 'user')
-    assistant_count = sum(1 for l in lines if l['role'] == 'assistant')
-    stats = _collect_code_stats(lines)
-    header = [
-        f"# 会话记录 {session_id}",
-        '',
-        '## 元数据',
-        '',
-        f'- 发起者: `{requester}`',
-        f'- 响应者: `{responder}`',
-        f'- 条目总数: {len(lines)}',
-        f'- 用户消息数: {user_count}',
-        f'- 助手消息数: {assistant_count}',
-        f"- 代码块数量: {stats['code_blocks']}",
-        f"- 代码块行数: {stats['code_block_lines']}",
-    ]
+    stats = _collect_stats(lines)
+    # 单个 StringIO 缓冲逐段写入, 不再构建 header/body 列表后整体 join
+    buf = io.StringIO()
+    w = buf.write
+    w(f"# 会话记录 {session_id}\n"
+      '\n'
+      '## 元数据\n'
+      '\n'
+      f'- 发起者: `{requester}`\n'
+      f'- 响应者: `{responder}`\n'
+      f'- 条目总数: {len(lines)}\n'
+      f"- 用户消息数: {stats['user_count']}\n"
+      f"- 助手消息数: {stats['assistant_count']}\n"
+      f"- 代码块数量: {stats['code_blocks']}\n"
+      f"- 代码块行数: {stats['code_block_lines']}\n")
     if stats['code_langs']:
         langs_sorted = sorted(stats['code_langs'].items(), key=lambda x: (-x[1], x[0]))
-        header.append('- 代码语言分布: ' + ', '.join(f"{k}:{v}" for k,v in langs_sorted))
-    header.extend(['', '---', ''])
-    body: List[str] = []
+        w('- 代码语言分布: ' + ', '.join(f"{k}:{v}" for k,v in langs_sorted) + '\n')
+    w('\n---\n\n')
     msg_counter = 0
     for line in lines:
         msg_counter += 1
@@ -228,20 +277,13 @@ def render_markdown(data: Dict[str, Any], lines: List[Line], embed_ctx: Optional
         rid = line.get('requestId') or ''
         local_time_full = line.get('localTime') or ''
         utc_time_full = line.get('utcTime') or ''
-        # 提取 HH:MM 作为标题中的简短时间
-        short_time = ''
-        if local_time_full:
-            m = re.search(r'\b(\d{2}:\d{2}):\d{2}\b', local_time_full)
-            if m:
-                short_time = m.group(1)
-            else:
-                # 如果匹配不到秒，尝试直接找 HH:MM
-                m2 = re.search(r'\b(\d{2}:\d{2})\b', local_time_full)
-                if m2:
-                    short_time = m2.group(1)
+        # 提取 HH:MM 作为标题中的简短时间 (localTime 由 _format_timestamp 生成, 格式固定, 直接切片)
+        if len(local_time_full) >= 16 and local_time_full[13] == ':':
+            short_time = local_time_full[11:16]
+        else:
+            short_time = ''
         title_extra = f" {short_time}" if short_time else ''
-        anchor_title = f"### {msg_counter}. {role}{title_extra}"
-        body.append(anchor_title)
+        w(f"### {msg_counter}. {role}{title_extra}\n")
         # 引用块中的详细元数据
         meta_lines = []
         if rid:
@@ -251,58 +293,88 @@ def render_markdown(data: Dict[str, Any], lines: List[Line], embed_ctx: Optional
         if utc_time_full:
             meta_lines.append(f"UTC: {utc_time_full}")
         if meta_lines:
-            body.append('')
-            body.append('> ' + '\n> '.join(meta_lines))
-        body.append('')
-        body.append(line['content'])
+            w('\n> ' + '\n> '.join(meta_lines) + '\n')
+        w('\n')
+        w(line['content'])
+        w('\n')
         # 文件嵌入段
         if embed_ctx and embed_ctx.get('enable'):
             file_refs = line.get('fileRefs') or []
-            injected_parts: List[str] = []
+            has_attachment = False
             for fr in file_refs:
                 embed_md = try_embed_file(fr, embed_ctx)
                 if embed_md:
-                    injected_parts.append(embed_md)
-            if injected_parts:
-                body.append('')
-                body.append('#### 附件')
-                body.extend(injected_parts)
-        body.append('')
-    return '\n'.join(header + body).rstrip() + '\n'
+                    if not has_attachment:
+                        w('\n#### 附件\n')
+                        has_attachment = True
+                    w(embed_md)
+                    w('\n')
+        w('\n')
+    return buf.getvalue().rstrip() + '\n'
 
 # ---------------- 文件嵌入支持 ----------------
-IMAGE_EXTS: Set[str] = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg'}
-VIDEO_EXTS: Set[str] = {'.mp4', '.mov', '.webm', '.mkv', '.avi'}
-TEXT_EXTS: Set[str] = {'.txt', '.log', '.json', '.xml', '.yml', '.yaml', '.md', '.csv'}
-CODE_EXTS: Set[str] = {'.cs', '.ts', '.js', '.tsx', '.jsx', '.py', '.java', '.go', '.rs', '.cpp', '.c', '.h', '.sql', '.ps1', '.sh'}
+IMAGE_EXTS: FrozenSet[str] = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg'})
+VIDEO_EXTS: FrozenSet[str] = frozenset({'.mp4', '.mov', '.webm', '.mkv', '.avi'})
+TEXT_EXTS: FrozenSet[str] = frozenset({'.txt', '.log', '.json', '.xml', '.yml', '.yaml', '.md', '.csv'})
+CODE_EXTS: FrozenSet[str] = frozenset({'.cs', '.ts', '.js', '.tsx', '.jsx', '.py', '.java', '.go', '.rs', '.cpp', '.c', '.h', '.sql', '.ps1', '.sh'})
+# 文本与代码走同一内联分支, 合并为一次成员判断
+_TEXTISH_EXTS: FrozenSet[str] = TEXT_EXTS | CODE_EXTS
+_LANG_MAP: Dict[str, str] = {
+    '.cs': 'csharp', '.ts': 'typescript', '.js': 'javascript', '.tsx': 'tsx', '.jsx': 'jsx', '.py': 'python',
+    '.java': 'java', '.go': 'go', '.rs': 'rust', '.cpp': 'cpp', '.c': 'c', '.h': 'c', '.sql': 'sql',
+    '.ps1': 'powershell', '.sh': 'bash', '.json': 'json', '.yml': 'yaml', '.yaml': 'yaml'
+}
 
 def build_embed_context(args) -> Dict[str, Any]:
     return {
         'enable': True,
         'file_root': os.path.abspath(args.file_root),
-        'img_max': args.image_max_bytes,
-        'text_max': args.text_max_bytes,
+        # (图片, 文本) 最大字节数, 构建时转为普通 int 元组, 嵌入时一次解包
+        'limits': (int(args.image_max_bytes), int(args.text_max_bytes)),
         'assets_dir_name': args.assets_dir_name,
-    'verbose': getattr(args, 'embed_verbose', False),
+        'verbose': getattr(args, 'embed_verbose', False),
+        # 文件名索引 (首次模糊查找时惰性构建; 可变容器, 浅拷贝的 ctx 之间共享)
+        'name_index': {},
     }
 
 def safe_read_bytes(path: str, max_len: int) -> Optional[bytes]:
     try:
-        size = os.path.getsize(path)
-        if size > max_len:
-            return None
+        # 打开后用 fstat 取大小, 省去一次按路径 stat
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > max_len:
+                return None
+            return f.read()
+    except Exception:
+        return None
+
+# 超过该大小的文本文件使用 mmap 读取, 直接从映射解码, 省去一次整块拷贝
+MMAP_THRESHOLD = 64 * 1024
+
+def safe_read_buffer(path: str, max_len: int):
+    """同 safe_read_bytes, 但大于 MMAP_THRESHOLD 时返回只读 mmap (调用方负责 close)."""
+    try:
         with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > max_len:
+                return None
+            if size > MMAP_THRESHOLD:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
             return f.read()
     except Exception:
         return None
 
+def _decode_text(buf) -> Optional[str]:
+    """按 utf-8 → gbk 顺序解码 bytes 或 mmap, 均失败返回 None."""
+    try:
+        return str(buf, 'utf-8')
+    except UnicodeDecodeError:
+        try:
+            return str(buf, 'gbk')
+        except Exception:
+            return None
+
 def guess_code_language(ext: str) -> str:
-    mapping = {
-        '.cs': 'csharp', '.ts': 'typescript', '.js': 'javascript', '.tsx': 'tsx', '.jsx': 'jsx', '.py': 'python',
-        '.java': 'java', '.go': 'go', '.rs': 'rust', '.cpp': 'cpp', '.c': 'c', '.h': 'c', '.sql': 'sql',
-        '.ps1': 'powershell', '.sh': 'bash', '.json': 'json', '.yml': 'yaml', '.yaml': 'yaml'
-    }
-    return mapping.get(ext.lower(), '')
+    return _LANG_MAP.get(ext.lower(), '')
 
 def ensure_assets_dir(md_output_path: str, assets_dir_name: str) -> str:
     base_dir = os.path.dirname(os.path.abspath(md_output_path))
@@ -323,20 +395,40 @@ def _normalize_raw_path(raw_path: str) -> str:
     raw = raw_path.strip().strip('"').strip("'")
     raw = _decode_file_uri(raw)
     # 处理 /d:/xxx => d:/xxx
-    if re.match(r'^/[A-Za-z]:', raw):
+    if _WIN_DRIVE_RE.match(raw):
         raw = raw[1:]
     # VS Code 某些变量可能给出 d%3A/ 形式已在 _decode_file_uri 中处理
     raw = raw.replace('\\', '/')
-    # 避免出现 // 连续
-    while '//' in raw:
-        raw = raw.replace('//', '/')
+    # 避免出现 // 连续 (单次线性替换)
+    raw = _MULTI_SLASH_RE.sub('/', raw)
     # 对 Windows 绝对路径保持驱动器大小写原样; normpath 会把正斜杠替换为反斜杠(Windows)，这里先记录
     normed = os.path.normpath(raw)
     return normed
 
 def _simplify_name(name: str) -> str:
     """用于模糊匹配的名称简化: 去除所有空白并小写."""
-    return re.sub(r'\s+', '', name).lower()
+    return _WS_RE.sub('', name).lower()
+
+_NAME_INDEX_LOCK = threading.Lock()
+
+def _get_name_index(ctx: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """返回 (文件名 -> 所在目录, 简化文件名 -> 完整路径) 索引.
+    首次调用时遍历一次 file_root 并缓存到 ctx['name_index'], 之后查找为 O(1)。
+    """
+    holder = ctx.get('name_index')
+    if holder is None:
+        holder = ctx['name_index'] = {}
+    with _NAME_INDEX_LOCK:
+        if 'exact' not in holder:
+            exact: Dict[str, str] = {}
+            fuzzy: Dict[str, str] = {}
+            for dirpath, _d, files in os.walk(ctx['file_root']):
+                for f in files:
+                    exact.setdefault(f, dirpath)
+                    fuzzy.setdefault(_simplify_name(f), os.path.join(dirpath, f))
+            holder['fuzzy'] = fuzzy
+            holder['exact'] = exact
+    return holder['exact'], holder['fuzzy']
 
 def try_embed_file(ref, ctx: Dict[str, Any]) -> Optional[str]:
     # ref 可以是 str (旧) 或 {'display':..., 'path':...}
@@ -347,18 +439,20 @@ def try_embed_file(ref, ctx: Dict[str, Any]) -> Optional[str]:
         display = ref
         raw_path = ref
     root = ctx['file_root']
+    img_max, text_max = ctx['limits']
+    log = ctx.get('log') or print
     norm_raw = _normalize_raw_path(raw_path)
     if ctx.get('verbose') and norm_raw != raw_path:
-        print(f"[EMBED] 规范化路径: '{raw_path}' -> '{norm_raw}'")
+        log(f"[EMBED] 规范化路径: '{raw_path}' -> '{norm_raw}'")
     if ctx.get('verbose'):
-        print(f"[EMBED] 引用解析: display='{display}' raw_path='{norm_raw}' root='{root}'")
+        log(f"[EMBED] 引用解析: display='{display}' raw_path='{norm_raw}' root='{root}'")
     # 绝对路径或相对 file_root
     if os.path.isabs(norm_raw):
         candidate = norm_raw
     else:
         candidate = os.path.normpath(os.path.join(root, norm_raw))
     # 若初步不存在, 尝试再次处理 /d:/ 样式(防御性)
-    if not os.path.exists(candidate) and re.match(r'^/[A-Za-z]:', norm_raw):
+    if not os.path.exists(candidate) and _WIN_DRIVE_RE.match(norm_raw):
         alt = norm_raw[1:]
         candidate = alt if os.path.isabs(alt) else os.path.join(root, alt)
     # 不存在则尝试名称搜索 & 模糊匹配
@@ -366,47 +460,39 @@ def try_embed_file(ref, ctx: Dict[str, Any]) -> Optional[str]:
         base_name = os.path.basename(norm_raw)
         simple_target = _simplify_name(base_name)
         if ctx.get('verbose'):
-            print(f"[EMBED] 初始路径不存在, 开始遍历搜索文件名: {base_name} (simplified='{simple_target}')")
-        found_exact = None
-        found_fuzzy = None
-        for dirpath, _d, files in os.walk(root):
-            if base_name in files:
-                found_exact = os.path.join(dirpath, base_name)
-                break
-            # 模糊: 去空白 & 小写后全等
-            for f in files:
-                if _simplify_name(f) == simple_target:
-                    found_fuzzy = os.path.join(dirpath, f)
-                    break
-            if found_exact or found_fuzzy:
-                break
+            log(f"[EMBED] 初始路径不存在, 开始遍历搜索文件名: {base_name} (simplified='{simple_target}')")
+        exact_index, fuzzy_index = _get_name_index(ctx)
+        found_dir = exact_index.get(base_name)
+        found_exact = os.path.join(found_dir, base_name) if found_dir else None
+        # 模糊: 去空白 & 小写后全等
+        found_fuzzy = fuzzy_index.get(simple_target)
         if found_exact:
             candidate = found_exact
             if ctx.get('verbose'):
-                print(f"[EMBED] 名称搜索匹配(精确): {candidate}")
+                log(f"[EMBED] 名称搜索匹配(精确): {candidate}")
         elif found_fuzzy:
             candidate = found_fuzzy
             if ctx.get('verbose'):
-                print(f"[EMBED] 名称搜索匹配(模糊): {candidate}")
+                log(f"[EMBED] 名称搜索匹配(模糊): {candidate}")
         else:
             if ctx.get('verbose'):
-                print(f"[EMBED] 未找到文件: {raw_path}")
+                log(f"[EMBED] 未找到文件: {raw_path}")
             return None
     else:
         if ctx.get('verbose'):
-            print(f"[EMBED] 找到文件: {candidate}")
+            log(f"[EMBED] 找到文件: {candidate}")
     ext = os.path.splitext(candidate)[1].lower()
     # 判定 md 输出路径(推导): candidate 所在目录上一级
     # 在当前实现中我们无法直接得知单个 md 的输出路径，只能使用 candidate 同级输出相对路径(可能不理想)
     md_output_dummy = candidate  # 用其目录作为参考
     if ext in IMAGE_EXTS:
-        data = safe_read_bytes(candidate, ctx['img_max'])
+        data = safe_read_bytes(candidate, img_max)
         if not data:
             return f"(图片过大未嵌入: {display})"
-        b64 = base64.b64encode(data).decode('ascii')
+        b64 = _b64.b64encode(data).decode('ascii')
         mime = 'image/svg+xml' if ext == '.svg' else f"image/{ext.lstrip('.').replace('jpg','jpeg')}"
         if ctx.get('verbose'):
-            print(f"[EMBED] 嵌入图片: {candidate} -> base64 (size={len(b64)} chars)")
+            log(f"[EMBED] 嵌入图片: {candidate} -> base64 (size={len(b64)} chars)")
         return f"![{display}](data:{mime};base64,{b64})"
     if ext in VIDEO_EXTS:
         assets_dir = ensure_assets_dir(md_output_dummy, ctx['assets_dir_name'])
@@ -419,23 +505,24 @@ def try_embed_file(ref, ctx: Dict[str, Any]) -> Optional[str]:
                 return f"(视频复制失败 {display}: {e})"
         rel = os.path.relpath(target_path, os.path.dirname(md_output_dummy)).replace('\\', '/')
         if ctx.get('verbose'):
-            print(f"[EMBED] 视频复制: {candidate} -> {target_path}")
+            log(f"[EMBED] 视频复制: {candidate} -> {target_path}")
         return f"<video src='{rel}' controls style='max-width:100%;height:auto;'>您的浏览器不支持视频标签</video>"
-    if ext in TEXT_EXTS or ext in CODE_EXTS:
-        data = safe_read_bytes(candidate, ctx['text_max'])
+    if ext in _TEXTISH_EXTS:
+        data = safe_read_buffer(candidate, text_max)
         if not data:
             return f"(文本文件过大未内联: {display})"
         try:
-            text = data.decode('utf-8')
-        except UnicodeDecodeError:
-            try:
-                text = data.decode('gbk')
-            except Exception:
-                return f"(无法解码文本: {display})"
+            data_len = len(data)
+            text = _decode_text(data)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+        if text is None:
+            return f"(无法解码文本: {display})"
         lang = guess_code_language(ext)
         fence = lang if lang else ''
         if ctx.get('verbose'):
-            print(f"[EMBED] 内联文本/代码: {candidate} (lang={lang}, bytes={len(data)})")
+            log(f"[EMBED] 内联文本/代码: {candidate} (lang={lang}, bytes={data_len})")
         return f"```{fence}\n{text.rstrip()}\n```"
     # 其它类型: 复制到 assets 并给出链接
     assets_dir = ensure_assets_dir(md_output_dummy, ctx['assets_dir_name'])
@@ -448,21 +535,26 @@ def try_embed_file(ref, ctx: Dict[str, Any]) -> Optional[str]:
             return f"(文件复制失败 {display}: {e})"
     rel = os.path.relpath(target_path, os.path.dirname(md_output_dummy)).replace('\\', '/')
     if ctx.get('verbose'):
-        print(f"[EMBED] 复制其它类型文件: {candidate} -> {target_path}")
+        log(f"[EMBED] 复制其它类型文件: {candidate} -> {target_path}")
     return f"[附件 {display}]({rel})"
 
 def write_output(path: str, content: str) -> None:
     with open(path, 'w', encoding='utf-8', newline='') as f:
         f.write(content)
 
-def convert_file(input_path: str, output_path: Optional[str] = None, embed_ctx: Optional[Dict[str, Any]] = None) -> Optional[str]:
+def convert_file(input_path: str, output_path: Optional[str] = None, embed_ctx: Optional[Dict[str, Any]] = None,
+                 quiet: bool = False, log_cb: Optional[Callable[[str], None]] = None) -> Optional[str]:
+    """转换单个会话 JSON. quiet=True 时不输出逐文件 [OK] 日志 (告警仍输出);
+    log_cb: 日志回调 (缺省 print), 嵌入调试日志同样经由该回调输出。
+    """
+    log = log_cb or print
     try:
         data = load_json(input_path)
     except Exception as e:
-        print(f"[WARN] 读取失败 {input_path}: {e}")
+        log(f"[WARN] 读取失败 {input_path}: {e}")
         return None
     if not is_chat_session_json(data):
-        print(f"[WARN] 跳过 (非聊天会话结构): {input_path}")
+        log(f"[WARN] 跳过 (非聊天会话结构): {input_path}")
         return None
     if not output_path:
         base, _ = os.path.splitext(input_path)
@@ -474,26 +566,136 @@ def convert_file(input_path: str, output_path: Optional[str] = None, embed_ctx:
     if embed_ctx:
         ctx = dict(embed_ctx)
         ctx['current_md_path'] = output_path
+        ctx['log'] = log
     else:
         ctx = None
     md = render_markdown(data, lines, embed_ctx=ctx)
     write_output(output_path, md)
-    print(f"[OK] {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
+    if not quiet:
+        log(f"[OK] {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
     return output_path
 
+def iter_json_entries(root: str) -> Iterator[os.DirEntry]:
+    """递归遍历 root 下的 *.json, 产出 os.DirEntry (基于 os.scandir, 顺序与 os.walk 一致).
+    仅按 entry.name 筛选 (目录读取时已得到), 不做 stat; 需要 stat 的调用方可复用 DirEntry 缓存。
+    """
+    try:
+        it = os.scandir(root)
+    except OSError:
+        return
+    subdirs: List[str] = []
+    with it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+            except OSError:
+                continue
+            if entry.name.lower().endswith('.json'):
+                yield entry
+    for d in subdirs:
+        yield from iter_json_entries(d)
+
+def iter_json_files(root: str) -> Iterator[str]:
+    """递归遍历 root 下的 *.json 路径."""
+    for entry in iter_json_entries(root):
+        yield entry.path
+
+# 进程池 worker 内的取消标记 (由 initializer 注入, threading.Event 无法跨进程传递;
+# 调用方传入 multiprocessing.Event 时直接共享, 设置后各 worker 在下一个文件边界即可感知)
+_worker_cancel = None
+# 进程池 worker 内的嵌入上下文: 每个 worker 只反序列化一次, 文件名索引 (name_index) 也只需构建一次,
+# 不再随每个任务 pickle 传递 (否则每个文件都会得到空索引并重新遍历 file_root)
+_worker_embed_ctx: Optional[Dict[str, Any]] = None
+
+def _init_worker(cancel_event, embed_ctx: Optional[Dict[str, Any]] = None) -> None:
+    global _worker_cancel, _worker_embed_ctx
+    _worker_cancel = cancel_event
+    _worker_embed_ctx = embed_ctx
+
+def _convert_file_task(input_path: str, output_path: Optional[str],
+                       quiet: bool = False) -> Tuple[Optional[str], List[str]]:
+    """进程池任务: 已请求取消时直接跳过. 日志无法跨进程回调, 收集后随结果返回 (md 路径, 日志列表)."""
+    if _worker_cancel is not None and _worker_cancel.is_set():
+        return None, []
+    messages: List[str] = []
+    md = convert_file(input_path, output_path, embed_ctx=_worker_embed_ctx, quiet=quiet, log_cb=messages.append)
+    return md, messages
+
+# 目录模式不再逐文件输出 [OK], 改为每 N 个文件输出一次进度
+PROGRESS_PRINT_EVERY = 100
+
+def _report_progress(done: int, total: int, current: str,
+                     progress_cb: Optional[Callable[[int, int, str], None]],
+                     log: Callable[[str], None] = print) -> None:
+    if progress_cb:
+        progress_cb(done, total, current)
+    if done % PROGRESS_PRINT_EVERY == 0 and done != total:
+        log(f'[INFO] 进度: {done}/{total}')
+
+
+def _collect_json_files(root: str, file_filter: Optional[Callable[[str], bool]] = None,
+                        paths: Optional[Iterable[PathEntry]] = None,
+                        log: Callable[[str], None] = print) -> List[str]:
+    """收集 root 下所有 json 文件 (经 file_filter 过滤); 给出 paths 时直接使用, 不再遍历目录。
+    paths 元素可为路径或 (路径, os.stat_result); 已知 stat 时复用其 st_size, 空文件无需打开即跳过。
+    """
+    if paths is None:
+        candidates: Iterable[str] = iter_json_files(root)
+    else:
+        candidates = []
+        for item in paths:
+            if isinstance(item, tuple):
+                p, st = item
+                if st.st_size == 0:
+                    log(f"[WARN] 跳过 (空文件): {p}")
+                    continue
+            else:
+                p = item
+            candidates.append(p)
+    return [p for p in candidates if not file_filter or file_filter(p)]
+
+def _output_path_for(json_path: str, root: str, output_dir: Optional[str]) -> Optional[str]:
+    """目录模式下的输出路径: 指定 output_dir 时保持相对 root 的目录结构, 否则 None (与 JSON 同目录)."""
+    if not output_dir:
+        return None
+    rel_base, _ = os.path.splitext(os.path.relpath(json_path, root))
+    return os.path.join(output_dir, rel_base + '.md')
+
+def _with_stat(md_paths: List[str]) -> List[Tuple[str, os.stat_result]]:
+    """为刚写出的 Markdown 附上 stat 结果 (写入后即 stat, 聚合排序时不再重复遍历/stat)."""
+    out: List[Tuple[str, os.stat_result]] = []
+    for md in md_paths:
+        try:
+            out.append((md, os.stat(md)))
+        except OSError:
+            continue
+    return out
 
 def convert_path(path: str, embed_ctx: Optional[Dict[str, Any]] = None,
                  progress_cb: Optional[Callable[[int, int, str], None]] = None,
-                 cancel_flag: Optional[threading.Event] = None,
+                 cancel_flag: Optional[Any] = None,
                  parallel: bool = False, max_workers: Optional[int] = None,
                  output_dir: Optional[str] = None,
-                 file_filter: Optional[Callable[[str], bool]] = None) -> List[str]:
+                 file_filter: Optional[Callable[[str], bool]] = None,
+                 parallel_mode: str = 'process',
+                 paths: Optional[Iterable[PathEntry]] = None,
+                 log_cb: Optional[Callable[[str], None]] = None,
+                 with_stat: bool = False) -> List[Any]:
     """批量转换路径下 JSON 会话文件。
     progress_cb: (done, total, current_path)
-    cancel_flag: threading.Event() 被设置则中断
+    cancel_flag: threading.Event() 或 multiprocessing.Event() 被设置则中断 (多进程模式下后者直接共享给 worker)
     parallel: 并行转换
+    parallel_mode: 'process' 多进程 (默认, 绕过 GIL) | 'thread' 线程池
     file_filter: 用于过滤文件的回调函数，返回 True 表示保留文件
+    paths: 预先收集好的 JSON 文件列表 (位于 path 下), 给出时跳过目录遍历;
+           元素可为 (路径, os.stat_result), 复用遍历时已取得的 stat, 不再重复 stat
+    log_cb: 日志回调 (缺省 print); 线程/串行模式在 worker 内直接调用, 多进程模式由主循环转发
+    with_stat: 为 True 时返回 [(md 路径, os.stat_result)], 供聚合直接使用, 无需再遍历输出目录
+    返回: 生成的 Markdown 路径列表 (with_stat 时为二元组列表)
     """
+    log = log_cb or print
     if os.path.isfile(path):
         if cancel_flag and cancel_flag.is_set():
             return []
@@ -505,67 +707,121 @@ def convert_path(path: str, embed_ctx: Optional[Dict[str, Any]] = None,
             out_path = None
         if file_filter and not file_filter(path):
             return []
-        res = convert_file(path, out_path, embed_ctx=embed_ctx)
+        if paths is not None and path not in _collect_json_files(path, None, paths, log):
+            return []
+        res = convert_file(path, out_path, embed_ctx=embed_ctx, log_cb=log)
         if progress_cb:
             progress_cb(1, 1, path)
-        return [res] if res else []
-    # 收集所有 json 文件
-    all_json: List[str] = []
-    for root, _dirs, files in os.walk(path):
-        for fn in files:
-            if fn.lower().endswith('.json'):
-                full_path = os.path.join(root, fn)
-                if not file_filter or file_filter(full_path):
-                    all_json.append(full_path)
+        converted = [res] if res else []
+        return _with_stat(converted) if with_stat else converted
+    all_json = _collect_json_files(path, file_filter, paths, log)
     total = len(all_json)
     if total == 0:
-        print('[INFO] 未找到可转换的 JSON 文件')
+        log('[INFO] 未找到可转换的 JSON 文件')
         return []
     converted: List[str] = []
     done = 0
     if parallel and total > 1:
         if max_workers is None:
             max_workers = min(8, (os.cpu_count() or 4))
-        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        worker_cancel = None
+        if parallel_mode == 'process':
+            # 解析 JSON / 正则 / 渲染均为 CPU 密集, 多进程才能真正并行
+            if _ProcessEvent is not None and isinstance(cancel_flag, _ProcessEvent):
+                worker_cancel = cancel_flag
+            else:
+                worker_cancel = multiprocessing.Event()
+            ex = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(worker_cancel, embed_ctx))
+            task_fn = _convert_file_task
+        else:
+            ex = ThreadPoolExecutor(max_workers=max_workers)
+            task_fn = convert_file
+        with ex:
             future_map = {}
             for p in all_json:
-                if output_dir:
-                    rel = os.path.relpath(p, path)
-                    rel_base, _ = os.path.splitext(rel)
-                    out_path = os.path.join(output_dir, rel_base + '.md')
+                out_path = _output_path_for(p, path, output_dir)
+                if worker_cancel is not None:
+                    fut = ex.submit(task_fn, p, out_path, True)
                 else:
-                    out_path = None
-                future_map[ex.submit(convert_file, p, out_path, embed_ctx)] = p
+                    fut = ex.submit(task_fn, p, out_path, embed_ctx, True, log)
+                future_map[fut] = p
             for fut in as_completed(future_map):
                 p = future_map[fut]
                 if cancel_flag and cancel_flag.is_set():
+                    if worker_cancel is not None:
+                        worker_cancel.set()
+                    ex.shutdown(wait=False, cancel_futures=True)
                     break
-                md = fut.result()
+                if worker_cancel is not None:
+                    md, messages = fut.result()
+                    for m in messages:
+                        log(m)
+                else:
+                    md = fut.result()
                 if md:
                     converted.append(md)
                 done += 1
-                if progress_cb:
-                    progress_cb(done, total, p)
+                _report_progress(done, total, p, progress_cb, log)
     else:
         for p in all_json:
             if cancel_flag and cancel_flag.is_set():
                 break
-            if output_dir:
-                rel = os.path.relpath(p, path)
-                rel_base, _ = os.path.splitext(rel)
-                out_path = os.path.join(output_dir, rel_base + '.md')
-            else:
-                out_path = None
-            md = convert_file(p, out_path, embed_ctx=embed_ctx)
+            out_path = _output_path_for(p, path, output_dir)
+            md = convert_file(p, out_path, embed_ctx=embed_ctx, quiet=True, log_cb=log)
             if md:
                 converted.append(md)
             done += 1
-            if progress_cb:
-                progress_cb(done, total, p)
+            _report_progress(done, total, p, progress_cb, log)
+    if cancel_flag and cancel_flag.is_set():
+        log(f'[INFO] 已取消, 完成 {len(converted)}/{total}')
+    else:
+        log(f'[INFO] 完成: {len(converted)} / {total} 个文件')
+    return _with_stat(converted) if with_stat else converted
+
+async def convert_path_async(path: str, embed_ctx: Optional[Dict[str, Any]] = None,
+                             progress_cb: Optional[Callable[[int, int, str], None]] = None,
+                             cancel_flag: Optional[threading.Event] = None,
+                             max_workers: Optional[int] = None,
+                             output_dir: Optional[str] = None,
+                             file_filter: Optional[Callable[[str], bool]] = None,
+                             log_cb: Optional[Callable[[str], None]] = None) -> List[str]:
+    """convert_path 的异步版本, 适合网络共享 / 机械硬盘等 I/O 受限场景。
+    每个文件经 asyncio.to_thread 执行 convert_file, 由 Semaphore 限制并发数,
+    使多个文件的磁盘读写等待相互重叠。参数含义同 convert_path。
+    """
+    log = log_cb or print
+    if os.path.isfile(path):
+        return await asyncio.to_thread(convert_path, path, embed_ctx=embed_ctx, progress_cb=progress_cb,
+                                       cancel_flag=cancel_flag, output_dir=output_dir, file_filter=file_filter,
+                                       log_cb=log_cb)
+    all_json = await asyncio.to_thread(_collect_json_files, path, file_filter)
+    total = len(all_json)
+    if total == 0:
+        log('[INFO] 未找到可转换的 JSON 文件')
+        return []
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 4) + 4)
+    sem = asyncio.Semaphore(max_workers)
+    converted: List[str] = []
+    done = 0
+
+    async def run_one(p: str) -> None:
+        nonlocal done
+        async with sem:
+            if cancel_flag and cancel_flag.is_set():
+                return
+            md = await asyncio.to_thread(convert_file, p, _output_path_for(p, path, output_dir), embed_ctx, True, log)
+        if md:
+            converted.append(md)
+        done += 1
+        _report_progress(done, total, p, progress_cb, log)
+
+    await asyncio.gather(*(run_one(p) for p in all_json))
     if cancel_flag and cancel_flag.is_set():
-        print(f'[INFO] 已取消, 完成 {len(converted)}/{total}')
+        log(f'[INFO] 已取消, 完成 {len(converted)}/{total}')
     else:
-        print(f'[INFO] 完成: {len(converted)} / {total} 个文件')
+        log(f'[INFO] 完成: {len(converted)} / {total} 个文件')
     return converted
 
 def main():
@@ -579,6 +835,12 @@ def main():
     parser.add_argument('--text-max-bytes', type=int, default=200_000, help='文本/代码文件最大内联字节(默认200KB)')
     parser.add_argument('--assets-dir-name', default='assets', help='视频/大文件复制目标子目录名 (相对输出md所在目录)')
     parser.add_argument('--embed-verbose', action='store_true', help='嵌入文件时输出详细调试日志')
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument('--parallel', action='store_true', help='目录模式并行转换 (方式见 --parallel-mode)')
+    mode_group.add_argument('--async', dest='use_async', action='store_true',
+                            help='目录模式异步并发转换 (适合网络共享/机械硬盘等 I/O 受限场景)')
+    parser.add_argument('--parallel-mode', choices=['processes', 'threads'], default='processes',
+                        help='--parallel 的并行方式: processes(默认, 多进程) | threads(线程池)')
     args = parser.parse_args()
 
     path = args.input
@@ -590,7 +852,11 @@ def main():
         embed_ctx = build_embed_context(args)
     if os.path.isdir(path):
         print(f'[INFO] 目录模式: 递归转换 {os.path.abspath(path)}')
-        convert_path(path, embed_ctx=embed_ctx)
+        if args.use_async:
+            asyncio.run(convert_path_async(path, embed_ctx=embed_ctx))
+        else:
+            convert_path(path, embed_ctx=embed_ctx, parallel=args.parallel,
+                         parallel_mode='thread' if args.parallel_mode == 'threads' else 'process')
     else:
         out = convert_file(path, args.output, embed_ctx=embed_ctx)
         if out:
@@ -16,8 +16,13 @@ PyQt5 图形界面: 调用 chat_json_to_md.py 与 aggregate_markdown.py 两个
 from __future__ import annotations
 import os
 import sys
-import io
+import multiprocessing
+import re
+import stat
+import time
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
 from datetime import datetime, timedelta
 
@@ -27,7 +32,7 @@ try:
             QTextEdit, QCheckBox, QSpinBox, QComboBox, QFileDialog, QMessageBox, QGroupBox, QFormLayout,
             QProgressBar, QDateEdit
         )
-    from PyQt5.QtCore import QThread, pyqtSignal, QDate
+    from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal, QDate
 except ImportError:
     print("[ERROR] 未安装 PyQt5, 请先执行: pip install PyQt5")
     sys.exit(1)
@@ -45,6 +50,67 @@ except Exception as e:  # noqa
     sys.exit(1)
 
 DEFAULT_ROOT = os.path.join(os.path.expanduser('~'), 'AppData', 'Roaming', 'Code', 'User', 'workspaceStorage')
+# 进度信号最小发射间隔 (秒), 约 30 次/秒, 避免每个文件都跨线程排队并重绘
+PROGRESS_EMIT_INTERVAL = 0.033
+# 日志缓冲刷新间隔 (毫秒) 与日志窗口最大保留行数
+LOG_FLUSH_INTERVAL_MS = 100
+LOG_MAX_BLOCKS = 5000
+# 非 Windows 平台并发 stat 的线程数
+STAT_WORKERS = 32
+
+def _collect_filtered_files(root: str, start_date, end_date,
+                            cancel_flag=None) -> list[tuple[str, os.stat_result]]:
+    """收集 root 下创建日期在 [start_date, end_date] 内的 *.json, 返回 (路径, stat) 供转换复用。
+    先由 chat_json_to_md.iter_json_entries 按文件名筛出候选 (不 stat), 再取 ctime:
+      - Windows: DirEntry.stat() 随目录读取缓存, 直接读取即可
+      - 其它平台: DirEntry.stat() 仍需系统调用, 用线程池并发 stat 以掩盖 I/O 延迟
+    cancel_flag: 被设置时提前结束。
+    """
+    matched: list[tuple[str, os.stat_result]] = []
+
+    # 日期边界预先换算为本地时间戳 [start_ts, end_ts), 逐文件只做浮点比较
+    start_ts = datetime.combine(start_date, datetime.min.time()).timestamp()
+    end_ts = datetime.combine(end_date + timedelta(days=1), datetime.min.time()).timestamp()
+
+    def in_range(ctime: float) -> bool:
+        return start_ts <= ctime < end_ts
+
+    # root 本身只 stat 一次 (同时判断文件/目录), 不再 isfile 后重复 stat
+    try:
+        root_st = os.stat(root)
+    except OSError:
+        return matched
+    if stat.S_ISREG(root_st.st_mode):
+        if in_range(root_st.st_ctime):
+            matched.append((root, root_st))
+        return matched
+
+    # 仅按 entry.name (目录读取时已得到, 无系统调用) 筛出 .json 候选, 其余文件从不 stat
+    candidates = list(chat_json_to_md.iter_json_entries(root))
+
+    def stat_entry(entry: os.DirEntry):
+        try:
+            return entry.path, entry.stat(follow_symlinks=False)
+        except OSError:
+            return entry.path, None
+
+    def consume(results) -> bool:
+        for path, st in results:
+            if cancel_flag and cancel_flag.is_set():
+                return False
+            if st is None:
+                continue
+            if in_range(st.st_ctime):
+                matched.append((path, st))
+        return True
+
+    if os.name == 'nt' or len(candidates) < 2:
+        consume(map(stat_entry, candidates))
+    else:
+        with ThreadPoolExecutor(max_workers=STAT_WORKERS) as ex:
+            if not consume(ex.map(stat_entry, candidates)):
+                ex.shutdown(wait=False, cancel_futures=True)
+    return matched
 
 class WorkerThread(QThread):
     log_signal = pyqtSignal(str)
@@ -61,22 +127,32 @@ class WorkerThread(QThread):
             result = self.task_fn(*self.args, **self.kwargs)
             self.done_signal.emit(True, str(result) if result else '')
         except Exception:
-            buf = io.StringIO()
-            traceback.print_exc(file=buf)
-            self.log_signal.emit(buf.getvalue())
+            self.log_signal.emit(traceback.format_exc())
             self.done_signal.emit(False, '执行出错')
 
 class MainWindow(QWidget):
     # 进度信号: done, total, current_file
     progress_signal = pyqtSignal(int, int, str)
+    # 聚合写出进度信号: 已写 KiB, 总 KiB (与文件数进度分开显示单位)
+    write_progress_signal = pyqtSignal(int, int)
+    # 工作线程日志 (转换脚本经 log_cb 输出), 排队到主线程写入日志缓冲
+    _thread_safe_log = pyqtSignal(str)
     def __init__(self):
         super().__init__()
         self.setWindowTitle('Chat JSON → Markdown / 聚合')
         self.resize(960, 720)
         self._threads: list[WorkerThread] = []
         self._cancel_flag = None
+        self._log_buf: deque[str] = deque()
         self._build_ui()
-        self.progress_signal.connect(self._on_progress)
+        # 两个信号均由工作线程发射, 显式排队到主线程 (不依赖每次发射时的 AutoConnection 线程判断)
+        self.progress_signal.connect(self._on_progress, type=Qt.QueuedConnection)
+        self.write_progress_signal.connect(self._on_write_progress, type=Qt.QueuedConnection)
+        self._thread_safe_log.connect(self._append_log, type=Qt.QueuedConnection)
+        # 日志先进缓冲, 定时一次性写入, 避免逐行触发文本排版
+        self._log_timer = QTimer(self)
+        self._log_timer.timeout.connect(self._flush_log)
+        self._log_timer.start(LOG_FLUSH_INTERVAL_MS)
 
     def _build_ui(self):
         layout = QVBoxLayout(self)
@@ -126,7 +202,13 @@ class MainWindow(QWidget):
         self.sort_mode_combo = QComboBox(); self.sort_mode_combo.addItems(['name', 'mtime'])
         self.include_edit = QLineEdit('')
         self.exclude_edit = QLineEdit('')
-        self.preset_combo = QComboBox(); self.preset_combo.addItems(['(无)', '仅会话:.*', '排除聚合:^AGGREGATED\\.md$', '排除assets:(^|/)assets/'])
+        # 预设标签 -> (纳入正则, 排除正则); None 表示保持该输入框不变
+        self._presets = {
+            '仅会话:.*': (r'.*', None),
+            '排除聚合:^AGGREGATED\\.md$': (None, r'^AGGREGATED\.md$'),
+            '排除assets:(^|/)assets/': (None, r'(^|/)assets/'),
+        }
+        self.preset_combo = QComboBox(); self.preset_combo.addItems(['(无)', *self._presets])
         self.preset_combo.currentIndexChanged.connect(self._apply_preset)
         agg_form.addRow(QLabel('输出文件名:'), self.output_md_edit)
         agg_form.addRow(QLabel('排序:'), self.sort_mode_combo)
@@ -178,6 +260,7 @@ class MainWindow(QWidget):
 
         # 日志
         self.log_edit = QTextEdit(); self.log_edit.setReadOnly(True)
+        self.log_edit.document().setMaximumBlockCount(LOG_MAX_BLOCKS)
         layout.addWidget(self.log_edit, 1)
         self.setLayout(layout)
 
@@ -185,12 +268,18 @@ class MainWindow(QWidget):
     def _append_log(self, text: str):
         if not text.endswith('\n'):
             text += '\n'
+        self._log_buf.append(text)
+
+    def _flush_log(self):
+        if not self._log_buf:
+            return
+        text = ''.join(self._log_buf)
+        self._log_buf.clear()
         self.log_edit.moveCursor(self.log_edit.textCursor().End)
         self.log_edit.insertPlainText(text)
         self.log_edit.moveCursor(self.log_edit.textCursor().End)
 
     def _choose_root(self):
-        from PyQt5.QtWidgets import QFileDialog
         d = QFileDialog.getExistingDirectory(self, '选择根目录', self.path_edit.text() or DEFAULT_ROOT)
         if d:
             self.path_edit.setText(d)
@@ -198,7 +287,6 @@ class MainWindow(QWidget):
                 self.file_root_edit.setText(d)
 
     def _choose_output_dir(self):
-        from PyQt5.QtWidgets import QFileDialog
         d = QFileDialog.getExistingDirectory(self, '选择输出目录', self.output_dir_edit.text() or self.path_edit.text() or DEFAULT_ROOT)
         if d:
             self.output_dir_edit.setText(d)
@@ -216,43 +304,53 @@ class MainWindow(QWidget):
         return chat_json_to_md.build_embed_context(args)
 
     def _apply_preset(self):
-        text = self.preset_combo.currentText()
-        if text.startswith('仅会话'):
-            self.include_edit.setText(r'.*')
-        elif text.startswith('排除聚合'):
-            self.exclude_edit.setText(r'^AGGREGATED\.md$')
-        elif text.startswith('排除assets'):
-            self.exclude_edit.setText(r'(^|/)assets/')
-        else:
-            # 清空
-            pass
-
-    def _capture_stdout(self, func, *a, **kw):
-        buf = io.StringIO()
-        old = sys.stdout
-        try:
-            sys.stdout = buf
-            return func(*a, **kw), buf.getvalue()
-        finally:
-            sys.stdout = old
+        # (无) 不在表中: 不修改
+        inc, exc = self._presets.get(self.preset_combo.currentText(), (None, None))
+        if inc is not None:
+            self.include_edit.setText(inc)
+        if exc is not None:
+            self.exclude_edit.setText(exc)
+
+    def _compile_filters(self):
+        """在 UI 线程预编译纳入/排除正则; 无效时弹窗提示并返回 None."""
+        compiled = []
+        for label, edit in (('纳入文件', self.include_edit), ('排除文件', self.exclude_edit)):
+            text = edit.text().strip()
+            try:
+                compiled.append(re.compile(text) if text else None)
+            except re.error as e:
+                QMessageBox.warning(self, '错误', f'{label}正则无效: {e}')
+                return None
+        return tuple(compiled)
 
     def _toggle_buttons(self, enable: bool):
         for b in (self.btn_generate, self.btn_aggregate, self.btn_both):
             b.setEnabled(enable)
 
     # ---------- Tasks ----------
+    def _make_progress_cb(self, emit=None):
+        """返回节流的进度回调: 最多每 PROGRESS_EMIT_INTERVAL 秒发射一次信号, 完成 (done == total) 时必定发射.
+        emit 缺省为 progress_signal.emit.
+        """
+        emit = emit or self.progress_signal.emit
+        last_emit = 0.0
+        def progress_cb(done, total, *rest):
+            nonlocal last_emit
+            now = time.monotonic()
+            if done == total or now - last_emit >= PROGRESS_EMIT_INTERVAL:
+                last_emit = now
+                # 发射信号到主线程
+                emit(done, total, *rest)
+        return progress_cb
+
     def _task_generate(self, root_path: str, embed_ctx):
         cancel_flag = self._cancel_flag
-        def progress_cb(done, total, current):
-            # 发射信号到主线程
-            self.progress_signal.emit(done, total, current)
+        progress_cb = self._make_progress_cb()
         output_dir = self.output_dir_edit.text().strip() or None
         start_date = self.start_date_edit.date().toPyDate()
         end_date = self.end_date_edit.date().toPyDate()
-        
-        def date_filter(file_path):
-            file_creation_date = datetime.fromtimestamp(os.path.getctime(file_path)).date()
-            return start_date <= file_creation_date <= end_date
+        # 按创建日期预先筛选 (一次遍历, 复用 DirEntry 的 stat 结果)
+        paths = _collect_filtered_files(root_path, start_date, end_date, cancel_flag)
 
         return chat_json_to_md.convert_path(
             root_path,
@@ -261,11 +359,21 @@ class MainWindow(QWidget):
             cancel_flag=cancel_flag,
             parallel=self.parallel_chk.isChecked(),
             output_dir=output_dir,
-            file_filter=date_filter  # 添加文件过滤器
+            paths=paths,
+            log_cb=self._thread_safe_log.emit
         )
 
-    def _task_aggregate(self, root_path: str, output_file: str, sort_mode: str, inc: str|None, exc: str|None):
-        return aggregate_markdown.aggregate(root_path, output_file, sort_mode, inc or None, exc or None)
+    def _make_chunk_cb(self):
+        """聚合写出进度回调: 字节数向上取整为 KiB (避免超出信号 int 范围, 小文件也不会显示 0/0), 节流后发射."""
+        progress_cb = self._make_progress_cb(self.write_progress_signal.emit)
+        def chunk_cb(bytes_written, total_bytes):
+            progress_cb((bytes_written + 1023) >> 10, (total_bytes + 1023) >> 10)
+        return chunk_cb
+
+    def _task_aggregate(self, root_path: str, output_file: str, sort_mode: str,
+                        inc: re.Pattern[str]|None, exc: re.Pattern[str]|None):
+        return aggregate_markdown.aggregate(root_path, output_file, sort_mode, inc, exc,
+                                            chunk_cb=self._make_chunk_cb())
 
     def _run_generate(self):
         root_path = self.path_edit.text().strip()
@@ -274,7 +382,7 @@ class MainWindow(QWidget):
             return
         self._reset_progress()
         embed_ctx = self._make_embed_ctx()
-        self._append_log(f"[{datetime.now().strftime('%H:%M:%S')}] 生成 Markdown 开始")
+        self._append_log(f"[{self._ts()}] 生成 Markdown 开始")
         self._start_thread(self._task_generate, root_path, embed_ctx)
 
     def _run_aggregate(self):
@@ -290,9 +398,12 @@ class MainWindow(QWidget):
         os.makedirs(search_dir, exist_ok=True)
         output_file = os.path.join(search_dir, self.output_md_edit.text().strip() or 'AGGREGATED.md')
         sort_mode = self.sort_mode_combo.currentText()
-        inc = self.include_edit.text().strip() or None
-        exc = self.exclude_edit.text().strip() or None
-        self._append_log(f"[{datetime.now().strftime('%H:%M:%S')}] 聚合 Markdown ({search_dir}) -> {output_file}")
+        patterns = self._compile_filters()
+        if patterns is None:
+            return
+        inc, exc = patterns
+        self._reset_progress()
+        self._append_log(f"[{self._ts()}] 聚合 Markdown ({search_dir}) -> {output_file}")
         self._start_thread(self._task_aggregate, search_dir, output_file, sort_mode, inc, exc)
 
     def _run_both(self):
@@ -306,53 +417,74 @@ class MainWindow(QWidget):
         os.makedirs(base_dir, exist_ok=True)
         output_file = os.path.join(base_dir, self.output_md_edit.text().strip() or 'AGGREGATED.md')
         sort_mode = self.sort_mode_combo.currentText()
-        inc = self.include_edit.text().strip() or None
-        exc = self.exclude_edit.text().strip() or None
+        patterns = self._compile_filters()
+        if patterns is None:
+            return
+        inc, exc = patterns
 
         def seq_task():
             cancel_flag = self._cancel_flag
-            def progress_cb(done, total, current):
-                self.progress_signal.emit(done, total, current)
-            chat_json_to_md.convert_path(
+            progress_cb = self._make_progress_cb()
+            generated = chat_json_to_md.convert_path(
                 root_path,
                 embed_ctx=embed_ctx,
                 progress_cb=progress_cb,
                 cancel_flag=cancel_flag,
                 parallel=self.parallel_chk.isChecked(),
-                output_dir=base_dir
+                output_dir=base_dir,
+                log_cb=self._thread_safe_log.emit,
+                with_stat=True
             )
             if cancel_flag and cancel_flag.is_set():
                 return '已取消'
-            aggregate_markdown.aggregate(base_dir, output_file, sort_mode, inc, exc)
+            # 直接聚合本次生成的文件 (已带 stat), 不再重新遍历输出目录
+            entries = [(md, st.st_mtime) for md, st in generated]
+            if not entries:
+                return '未生成可聚合的 Markdown 文件'
+            aggregate_markdown.aggregate_from_list(entries, base_dir, output_file, sort_mode, inc, exc,
+                                                   chunk_cb=self._make_chunk_cb())
             return output_file
 
-        self._append_log(f"[{datetime.now().strftime('%H:%M:%S')}] 生成并聚合 开始")
+        self._append_log(f"[{self._ts()}] 生成并聚合 开始")
         self._start_thread(seq_task)
 
     def _start_thread(self, fn, *a):
         import threading
         self._toggle_buttons(False)
         self.btn_cancel.setEnabled(True)
-        self._cancel_flag = threading.Event()
+        # 并行 (多进程) 时使用进程间 Event, 由转换 worker 直接共享, 取消无需等待主循环转发
+        self._cancel_flag = multiprocessing.Event() if self.parallel_chk.isChecked() else threading.Event()
         th = WorkerThread(fn, *a)
         th.log_signal.connect(self._append_log)
         th.done_signal.connect(self._on_done)
+        th.finished.connect(self._on_thread_finished)
         th.start()
         self._threads.append(th)
 
+    def _on_thread_finished(self):
+        # run() 返回后移除引用并释放底层 QThread, 避免多次任务后线程对象持续累积
+        th = self.sender()
+        if th in self._threads:
+            self._threads.remove(th)
+        th.deleteLater()
+
     def _cancel_tasks(self):
         if self._cancel_flag:
             self._cancel_flag.set()
             self._append_log('请求取消...')
             self.btn_cancel.setEnabled(False)
 
+    @staticmethod
+    def _ts() -> str:
+        """日志时间戳 (time.strftime 直接格式化当前本地时间, 无需构造 datetime)."""
+        return time.strftime('%H:%M:%S')
+
     def _reset_progress(self):
         self.progress_bar.setValue(0)
         self.progress_label.setText('0/0')
 
     def _on_done(self, ok: bool, result: str):
-        ts = datetime.now().strftime('%H:%M:%S')
-        self._append_log(f"[{ts}] {'完成' if ok else '失败'} {result}")
+        self._append_log(f"[{self._ts()}] {'完成' if ok else '失败'} {result}")
         self._toggle_buttons(True)
         self.btn_cancel.setEnabled(False)
         self._cancel_flag = None
@@ -362,8 +494,15 @@ class MainWindow(QWidget):
         self.progress_bar.setValue(pct)
         self.progress_label.setText(f"{done}/{total}")
 
+    def _on_write_progress(self, done_kib: int, total_kib: int):
+        pct = int(done_kib / total_kib * 100) if total_kib else 0
+        self.progress_bar.setValue(pct)
+        self.progress_label.setText(f"写入 {done_kib}/{total_kib} KiB")
+
 
 def main():
+    # 打包为 exe 后并行模式使用进程池, 需要 freeze_support 防止子进程重复启动 GUI
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     w = MainWindow()
     w.show()